@@ -1,13 +1,17 @@
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import seaborn as sns
+import pyarrow.parquet as pq
+import matplotlib
+matplotlib.use("Agg")  # headless: no GUI backend needed to write PNGs
 import matplotlib.pyplot as plt
+from numba import njit
 
 ROOT = Path(__file__).resolve().parents[1]
 
-PANEL_FILE      = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.csv"
+PANEL_FILE      = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.parquet"
 CORR_TABLE      = ROOT / "data" / "processed" / "correlation_table.csv"
 CORR_PLOT       = ROOT / "data" / "processed" / "correlation_heatmap.png"
 DAILY_CORR_FILE = ROOT / "data" / "processed" / "daily_correlation.csv"
@@ -20,21 +24,65 @@ END_DATE   = pd.Timestamp("2025-11-17")
 # Rolling window size in calendar days / rows
 ROLL_WINDOW_DAYS = 5   # you can change to 10, 20, etc.
 
+# Output resolution: the published heatmap stays at 300 dpi; the intermediate
+# rolling-correlation plot defaults to 150 (override with PLOT_DPI=300)
+PUBLICATION_DPI = 300
+DPI = int(os.environ.get("PLOT_DPI", "150"))
+
+
+# Windows whose (n·Σx² − (Σx)²) is below this fraction of n·Σx² count as flat:
+# running-sum cancellation leaves ~1e-12 noise there, which pandas reports as NaN
+FLAT_EPS = 1e-9
+
+
+@njit(cache=True)
+def rolling_corr(r, s, window):
+    """
+    Rolling Pearson correlation of two float arrays (float32 in, float64 sums).
+    Keeps running sums and adds the new / subtracts the oldest point per step,
+    so each output costs O(1) instead of O(window).
+    Like pandas .rolling(window).corr(): the first window-1 rows are NaN, any
+    window holding a NaN in either series is NaN (NaN terms never enter the
+    sums, so a gap only affects the windows that contain it), and flat windows
+    are NaN.
+    """
+    n = r.shape[0]
+    out = np.full(n, np.nan)
+    sx = sy = sxx = syy = sxy = 0.0
+    n_nan = 0
+
+    for i in range(n):
+        x, y = r[i], s[i]
+        if np.isnan(x) or np.isnan(y):
+            n_nan += 1
+        else:
+            sx += x
+            sy += y
+            sxx += x * x
+            syy += y * y
+            sxy += x * y
+
+        if i >= window:
+            x0, y0 = r[i - window], s[i - window]
+            if np.isnan(x0) or np.isnan(y0):
+                n_nan -= 1
+            else:
+                sx -= x0
+                sy -= y0
+                sxx -= x0 * x0
+                syy -= y0 * y0
+                sxy -= x0 * y0
+
+        if i >= window - 1 and n_nan == 0:
+            vx = window * sxx - sx * sx
+            vy = window * syy - sy * sy
+            if vx > FLAT_EPS * window * sxx and vy > FLAT_EPS * window * syy:
+                out[i] = (window * sxy - sx * sy) / np.sqrt(vx * vy)
+
+    return out
 
-def main():
-    print(f"📄 Loading panel → {PANEL_FILE}")
-    df = pd.read_csv(PANEL_FILE)
-
-    # Ensure DATE exists and is datetime
-    if "DATE" not in df.columns:
-        raise KeyError("Expected a DATE column in the panel file.")
-    df["DATE"] = pd.to_datetime(df["DATE"])
-
-    # Filter to the desired date range
-    mask = (df["DATE"] >= START_DATE) & (df["DATE"] <= END_DATE)
-    df = df.loc[mask].sort_values("DATE").reset_index(drop=True)
-    print(f"📆 Filtered rows: {len(df)} (from {START_DATE.date()} to {END_DATE.date()})")
 
+def main():
     # We'll use a clean subset for correlation work
     # Keep the main price metrics + sentiment metrics
     price_cols = [
@@ -45,12 +93,29 @@ def main():
     ]
     sentiment_cols = ["DAILY_SENTIMENT", "POS_SHARE", "NEG_SHARE", "NUM_HEADLINES"]
 
-    # Only keep columns that actually exist in the panel
-    price_cols     = [c for c in price_cols if c in df.columns]
-    sentiment_cols = [c for c in sentiment_cols if c in df.columns]
+    # Ensure DATE exists (already datetime64 in the Parquet panel)
+    available = pq.read_schema(PANEL_FILE).names
+    if "DATE" not in available:
+        raise KeyError("Expected a DATE column in the panel file.")
 
+    # Only keep columns that actually exist in the panel
+    price_cols     = [c for c in price_cols if c in available]
+    sentiment_cols = [c for c in sentiment_cols if c in available]
     work_cols = ["DATE"] + price_cols + sentiment_cols
-    df = df[work_cols].copy()
+
+    # Date range filter is pushed down into the Parquet reader
+    print(f"📄 Loading panel → {PANEL_FILE}")
+    df = pd.read_parquet(
+        PANEL_FILE,
+        columns=work_cols,
+        filters=[("DATE", ">=", START_DATE), ("DATE", "<=", END_DATE)],
+    )
+    df = df.sort_values("DATE").reset_index(drop=True)
+    print(f"📆 Filtered rows: {len(df)} (from {START_DATE.date()} to {END_DATE.date()})")
+
+    # float32 is plenty for correlations on ~70 rows; halves bytes for the kernels
+    num_cols = price_cols + sentiment_cols
+    df[num_cols] = df[num_cols].astype(np.float32)
 
     # Drop rows where we don't have a RETURN value
     # (first row will typically have RETURN NaN)
@@ -61,18 +126,43 @@ def main():
     print("🔎 Numeric fields considered for GLOBAL correlation:")
     print(num_cols)
 
-    corr = df[num_cols].corr()
+    # Empty fields (e.g. NAVALUE) only yield NaN rows/cols, like pandas .corr()
+    filled = [c for c in num_cols if df[c].notna().any()]
+    if df[filled].isna().any().any():
+        # Gaps left → keep pandas' pairwise NA handling
+        corr = df[num_cols].corr()
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            C = np.corrcoef(
+                df[filled].to_numpy(dtype=np.float32), rowvar=False, dtype=np.float32
+            )
+        corr = pd.DataFrame(C, index=filled, columns=filled).reindex(
+            index=num_cols, columns=num_cols
+        )
 
     CORR_TABLE.parent.mkdir(parents=True, exist_ok=True)
     corr.to_csv(CORR_TABLE)
     print(f"📁 Correlation table saved → {CORR_TABLE}")
 
-    plt.figure(figsize=(12, 10))
-    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f")
-    plt.title("Correlation Heatmap: Sentiment vs Price Metrics")
-    plt.tight_layout()
-    plt.savefig(CORR_PLOT, dpi=300)
-    plt.close()
+    fig, ax = plt.subplots(figsize=(12, 10))
+    im = ax.imshow(corr.to_numpy(), cmap="coolwarm", vmin=-1, vmax=1)
+    ax.set_xticks(range(len(num_cols)))
+    ax.set_xticklabels(corr.columns, rotation=90)
+    ax.set_yticks(range(len(num_cols)))
+    ax.set_yticklabels(corr.index)
+
+    # Annotate each cell (empty fields stay blank)
+    for i in range(len(num_cols)):
+        for j in range(len(num_cols)):
+            val = corr.iat[i, j]
+            if not np.isnan(val):
+                ax.text(j, i, f"{val:.2f}", ha="center", va="center", fontsize=8)
+
+    fig.colorbar(im, ax=ax)
+    ax.set_title("Correlation Heatmap: Sentiment vs Price Metrics")
+    fig.tight_layout()
+    plt.savefig(CORR_PLOT, dpi=PUBLICATION_DPI)
+    plt.close(fig)
     print(f"📊 Correlation heatmap saved → {CORR_PLOT}")
 
     if "RETURN" in df.columns and "DAILY_SENTIMENT" in df.columns:
@@ -84,10 +174,13 @@ def main():
 
     # -------- 2) ROLLING DAILY CORRELATIONS --------
     # For each day, correlate RETURN with each sentiment metric
+    returns = df["RETURN"].to_numpy(dtype=np.float32)
     for col in sentiment_cols:
         new_name = f"RCORR_RETURN_{col}_{ROLL_WINDOW_DAYS}d"
         # Rolling correlation uses the last N calendar days in the window
-        df[new_name] = df["RETURN"].rolling(ROLL_WINDOW_DAYS).corr(df[col])
+        df[new_name] = rolling_corr(
+            returns, df[col].to_numpy(dtype=np.float32), ROLL_WINDOW_DAYS
+        )
         print(f"✅ Added rolling correlation column: {new_name}")
 
     # Save per-day rolling correlation table
@@ -106,7 +199,7 @@ def main():
         plt.xlabel("Date")
         plt.ylabel("Correlation")
         plt.tight_layout()
-        plt.savefig(DAILY_CORR_PLOT, dpi=300)
+        plt.savefig(DAILY_CORR_PLOT, dpi=DPI)
         plt.close()
         print(f"📉 Rolling correlation plot saved → {DAILY_CORR_PLOT}")
     else:
@@ -1,72 +1,88 @@
 import os
+import numpy as np
 import pandas as pd
+import polars as pl
 from pathlib import Path
 
+from cache_news import news_parquet
+
 ROOT = Path(__file__).resolve().parents[1]
 
-NEWS_FILE   = ROOT / "data" / "processed" / "news_AAPL.O_finbert.csv"
 PRICES_FILE = ROOT / "data" / "raw"       / "prices_AAPL.O.csv"
 OUTPUT_FILE = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.csv"
+# Typed copy of the panel for the analysis / plotting scripts
+OUTPUT_PARQUET = OUTPUT_FILE.with_suffix(".parquet")
+
+# Raw price fields the panel keeps (LSEG names, renamed in load_prices)
+PRICE_FIELDS = [
+    "TIMESTAMP", "TRDPRC_1", "HIGH_1", "LOW_1", "OPEN_PRC", "ACVOL_UNS",
+    "BID", "ASK", "TRNOVR_UNS", "VWAP", "BLKCOUNT", "BLKVOLUM",
+    "NUM_MOVES", "NAVALUE", "VWAP_VOL",
+]
+
+# Rename important fields
+PRICE_RENAME = {
+    "TRDPRC_1": "CLOSE",
+    "HIGH_1":   "HIGH",
+    "LOW_1":    "LOW",
+    "OPEN_PRC": "OPEN",
+    "ACVOL_UNS": "VOLUME"
+}
 
 
 def load_news():
-    df = pd.read_csv(NEWS_FILE)
+    lf = pl.scan_parquet(news_parquet())
 
     # Ensure DATE exists
-    if "DATE" not in df.columns:
+    if "DATE" not in lf.collect_schema().names():
         raise KeyError("FinBERT file must contain DATE column.")
 
-    # Convert DATE → date only
-    df["DATE"] = pd.to_datetime(df["DATE"], errors="coerce").dt.date
-
-    # Keep required columns
-    sentiment_cols = ["DATE", "FINBERT_SCORE", "FINBERT_LABEL",
-                      "FINBERT_POS", "FINBERT_NEG", "FINBERT_NEU"]
-
-    news = df[sentiment_cols].copy()
-
-    # Aggregate to 1 row per date:
+    # Aggregate to 1 row per date (native Polars expressions, no Python callbacks).
+    # FINBERT_LABEL is Categorical in the cache, so the label tests compare codes:
     daily = (
-        news.groupby("DATE")
-            .agg(
-                DAILY_SENTIMENT=("FINBERT_SCORE", "mean"),
-                NUM_HEADLINES=("FINBERT_SCORE", "count"),
-                POS_SHARE=("FINBERT_LABEL", lambda x: (x == "positive").mean()),
-                NEG_SHARE=("FINBERT_LABEL", lambda x: (x == "negative").mean()),
-            )
-            .reset_index()
+        lf.with_columns(pl.col("DATE").dt.date())
+        .filter(pl.col("DATE").is_not_null())
+        .group_by("DATE")
+        .agg(
+            pl.col("FINBERT_SCORE").mean().alias("DAILY_SENTIMENT"),
+            pl.len().alias("NUM_HEADLINES"),
+            (pl.col("FINBERT_LABEL") == "positive").mean().alias("POS_SHARE"),
+            (pl.col("FINBERT_LABEL") == "negative").mean().alias("NEG_SHARE"),
+        )
+        .sort("DATE")
+        .collect()
     )
 
     return daily
 
 
 def load_prices():
-    df = pd.read_csv(PRICES_FILE)
+    # Only parse the fields we use (missing ones are simply skipped)
+    df = pd.read_csv(PRICES_FILE, usecols=lambda c: c in PRICE_FIELDS)
 
     # Convert TIMESTAMP → DATE
-    df["TIMESTAMP"] = pd.to_datetime(df["TIMESTAMP"], errors="coerce")
-    df["DATE"] = df["TIMESTAMP"].dt.date
+    ts = pd.to_datetime(df["TIMESTAMP"], errors="coerce")
+    dates = ts.dt.normalize().to_numpy()
+
+    # Stable sort by DATE (NaT last), applied once to every column
+    order = np.argsort(dates, kind="mergesort")
 
-    # Rename important fields
-    rename = {
-        "TRDPRC_1": "CLOSE",
-        "HIGH_1":   "HIGH",
-        "LOW_1":    "LOW",
-        "OPEN_PRC": "OPEN",
-        "ACVOL_UNS": "VOLUME"
-    }
-    df.rename(columns=rename, inplace=True)
+    # Build the final frame in one go, renaming important fields
+    cols = {"TIMESTAMP": ts.to_numpy()[order]}
+    for c in df.columns.drop("TIMESTAMP"):
+        cols[PRICE_RENAME.get(c, c)] = df[c].to_numpy()[order]
+    cols["DATE"] = dates[order]
 
-    # Compute daily return
-    df = df.sort_values("DATE")
-    df["RETURN"] = df["CLOSE"].pct_change()
+    # Compute daily return on the already-sorted CLOSE
+    close = cols["CLOSE"].astype(np.float64)
+    cols["RETURN"] = np.concatenate(([np.nan], close[1:] / close[:-1] - 1.0))
 
-    return df
+    return pd.DataFrame(cols)
 
 
 def main():
     print("\n📥 Loading sentiment...")
-    news = load_news()
+    news = load_news().to_pandas()
     print(f"News rows: {len(news)}")
 
     print("\n📈 Loading prices...")
@@ -79,9 +95,11 @@ def main():
     # Save result
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
     panel.to_csv(OUTPUT_FILE, index=False)
+    panel.to_parquet(OUTPUT_PARQUET, engine="pyarrow", compression="snappy", index=False)
 
     print("\n✅ PANEL MERGED SUCCESSFULLY")
     print(f"Saved to: {OUTPUT_FILE}")
+    print(f"Parquet:  {OUTPUT_PARQUET}")
     print(f"Final rows: {len(panel)}")
     print("\nColumns:", list(panel.columns))
     print("\nPreview:\n", panel.head())
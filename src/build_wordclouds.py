@@ -1,15 +1,18 @@
 # build_wordclouds.py
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud, STOPWORDS
+import polars as pl
+from wordcloud import STOPWORDS
+
+from cache_news import news_parquet
+from wordcloud_utils import make_wordcloud, sentiment_word_counts, tokenize, word_counts
 
 # ------------ CONFIG ------------
 ROOT = Path(__file__).resolve().parents[1]
 
-NEWS_FILE   = ROOT / "data" / "processed" / "news_AAPL.O_finbert.csv"
 OUTPUT_DIR  = ROOT / "data" / "processed" / "wordclouds"
 
 # Adjust these if you want a different window
@@ -21,128 +24,97 @@ POS_THRESHOLD = 0.30
 NEG_THRESHOLD = -0.30
 # --------------------------------
 
-
-def make_wordcloud(text: str, title: str, out_path: Path):
-    """Generate and save a word cloud with a Top Words bar legend."""
-    if not text or not text.strip():
-        print(f"⚠️ Empty text for '{title}', skipping word cloud.")
-        return
-
-    # ---- Stopwords (LSEG + Apple specific noise) ----
-    custom_stopwords = STOPWORDS | {
+# ---- Stopwords (LSEG + Apple specific noise), built once, lowercased ----
+_STOPWORDS = frozenset(
+    s.lower() for s in STOPWORDS | {
         "Apple", "AAPL", "Inc", "says", "said", "Reuters",
         "NS", "RTTRS", "RTS", "NEWS", "BUSST", "HINDU", "CNBC",
         "ZACKS", "Ltd", "Corp"
     }
+)
 
-    # ---- Build word cloud ----
-    wc = WordCloud(
-        width=1600,
-        height=900,
-        background_color="white",
-        stopwords=custom_stopwords,
-        collocations=True,
-    ).generate(text)
-
-    # ---- Extract top words (normalized frequency 0–1) ----
-    word_freq = wc.words_  # dict: word -> normalized freq
-    top_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:20]
-
-    words = [w for w, _ in top_words]
-    freqs = [f for _, f in top_words]
-
-    # ---- Figure with 2 panels: word cloud + bar legend ----
-    fig, (ax_wc, ax_leg) = plt.subplots(
-        1, 2, figsize=(16, 8), gridspec_kw={"width_ratios": [3, 2]}
-    )
-
-    # Left: word cloud
-    ax_wc.imshow(wc, interpolation="bilinear")
-    ax_wc.axis("off")
-    ax_wc.set_title(title, fontsize=20)
-
-    # Right: horizontal bar chart of top words
-    y_pos = range(len(words))
-    ax_leg.barh(y_pos, freqs, color="purple", alpha=0.8)
-    ax_leg.set_yticks(y_pos)
-    ax_leg.set_yticklabels(words)
-    ax_leg.invert_yaxis()  # highest at top
-    ax_leg.set_xlabel("Normalized Frequency")
-    ax_leg.set_title("Top Words")
-
-    fig.tight_layout()
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(out_path, dpi=300, bbox_inches="tight")
-    plt.close(fig)
-
-    print(f"🖼 Word cloud saved → {out_path}")
+def _render_wordcloud_star(args):
+    """Unpack (counts, title, out_path) for ProcessPoolExecutor.map (must be picklable)."""
+    make_wordcloud(*args)
 
 
 def main():
-    print(f"📄 Loading news → {NEWS_FILE}")
-    df = pd.read_csv(NEWS_FILE)
-    print("📌 Columns:", list(df.columns))
-
-    # ---- Parse DATE (your file is dd-mm-yyyy) ----
-    df["DATE"] = pd.to_datetime(df["DATE"], dayfirst=True, errors="coerce")
-    df = df.dropna(subset=["DATE"])
-
-    print(
-        f"📅 Date range in file: {df['DATE'].min().date()} → {df['DATE'].max().date()}"
+    news_file = news_parquet()
+    print(f"📄 Loading news → {news_file}")
+    lf = pl.scan_parquet(news_file)
+    print("📌 Columns:", lf.collect_schema().names())
+
+    # ---- DATE is already datetime64 in the cache ----
+    first, last = (
+        lf.select(pl.col("DATE").min().alias("FIRST"), pl.col("DATE").max().alias("LAST"))
+          .collect()
+          .row(0)
+    )
+    print(f"📅 Date range in file: {first.date()} → {last.date()}")
+
+    # ---- Filter to window + real headlines (pushed down into the scan) ----
+    keep_cols = [c for c in ("DATE", "HEADLINE", "FINBERT_SCORE")
+                 if c in lf.collect_schema().names()]
+    df = (
+        lf.select(keep_cols)
+          .filter(
+              pl.col("DATE").is_between(START_DATE, END_DATE)
+              & (pl.col("HEADLINE").str.strip_chars().str.len_chars() > 0)
+          )
+          .collect()
+          .to_pandas()
     )
-
-    # ---- Filter to window ----
-    mask = (df["DATE"] >= START_DATE) & (df["DATE"] <= END_DATE)
-    df = df.loc[mask].copy()
     print(
-        f"🕒 Rows after date filter {START_DATE.date()} → {END_DATE.date()}: {len(df)}"
+        f"📰 Rows with non-empty HEADLINE in {START_DATE.date()} → {END_DATE.date()}: {len(df)}"
     )
 
-    # ---- Keep rows with real headlines ----
-    df["HEADLINE"] = df["HEADLINE"].astype(str)
-    df = df[df["HEADLINE"].str.strip() != ""]
-    print(f"📰 Rows with non-empty HEADLINE: {len(df)}")
+    # ---- Tokenize every headline once, count words per subset ----
+    tokens = tokenize(df["HEADLINE"])
+
+    if "FINBERT_SCORE" in df.columns:
+        all_ctr, pos_ctr, neg_ctr = sentiment_word_counts(
+            tokens, df["FINBERT_SCORE"], POS_THRESHOLD, NEG_THRESHOLD, _STOPWORDS
+        )
+    else:
+        all_ctr, pos_ctr, neg_ctr = word_counts(tokens, _STOPWORDS), None, None
 
     # ==================================================
     # 1) ALL HEADLINES
     # ==================================================
-    all_text = " ".join(df["HEADLINE"].tolist())
-    make_wordcloud(
-        all_text,
+    tasks = [(
+        all_ctr,
         "All Headlines (Aug–Nov 2025)",
         OUTPUT_DIR / "wordcloud_all_with_legend.png",
-    )
-
-    # ==================================================
-    # 2) VERY POSITIVE HEADLINES
-    # ==================================================
-    if "FINBERT_SCORE" in df.columns:
-        pos_df = df[df["FINBERT_SCORE"] >= POS_THRESHOLD]
-        pos_text = " ".join(pos_df["HEADLINE"].tolist())
-        print(f"🙂 Very positive headlines rows: {len(pos_df)}")
+    )]
 
-        make_wordcloud(
-            pos_text,
+    if pos_ctr is not None:
+        # ==================================================
+        # 2) VERY POSITIVE HEADLINES
+        # ==================================================
+        print(f"🙂 Very positive headlines rows: {(df['FINBERT_SCORE'] >= POS_THRESHOLD).sum()}")
+        tasks.append((
+            pos_ctr,
             f"Very Positive Headlines (FINBERT ≥ {POS_THRESHOLD})",
             OUTPUT_DIR / "wordcloud_positive_with_legend.png",
-        )
+        ))
 
         # ==================================================
         # 3) VERY NEGATIVE HEADLINES
         # ==================================================
-        neg_df = df[df["FINBERT_SCORE"] <= NEG_THRESHOLD]
-        neg_text = " ".join(neg_df["HEADLINE"].tolist())
-        print(f"🙁 Very negative headlines rows: {len(neg_df)}")
-
-        make_wordcloud(
-            neg_text,
+        print(f"🙁 Very negative headlines rows: {(df['FINBERT_SCORE'] <= NEG_THRESHOLD).sum()}")
+        tasks.append((
+            neg_ctr,
             f"Very Negative Headlines (FINBERT ≤ {NEG_THRESHOLD})",
             OUTPUT_DIR / "wordcloud_negative_with_legend.png",
-        )
+        ))
     else:
         print("⚠️ FINBERT_SCORE column not found – skipping pos/neg word clouds.")
 
+    # ---- Render independent clouds in parallel (layout + PNG holds the GIL) ----
+    with ProcessPoolExecutor(max_workers=len(tasks)) as ex:
+        list(ex.map(_render_wordcloud_star, tasks))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+# cache_news.py
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ------------ CONFIG ------------
+ROOT = Path(__file__).resolve().parents[1]
+
+NEWS_CSV     = ROOT / "data" / "processed" / "news_AAPL.O_finbert.csv"
+NEWS_PARQUET = ROOT / "data" / "processed" / "news_AAPL.O_finbert.parquet"
+
+FINBERT_FLOAT_COLS = ["FINBERT_POS", "FINBERT_NEG", "FINBERT_NEU", "FINBERT_SCORE"]
+# --------------------------------
+
+
+def table_with_metadata(df: pd.DataFrame, metadata: dict | None = None) -> pa.Table:
+    """Arrow table of df with extra string key/values merged into its schema metadata."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        extra = {k.encode(): v.encode() for k, v in metadata.items()}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **extra})
+    return table
+
+
+def write_news_parquet(df: pd.DataFrame, metadata: dict | None = None) -> Path:
+    """
+    Store a FinBERT news table as typed, compressed Parquet (the shared cache).
+    Optional string metadata is stored in the Parquet schema.
+    """
+    df = df.assign(
+        # FinBERT output carries DATE as dd/mm/yyyy → real datetime64 in the cache
+        DATE=pd.to_datetime(df["DATE"], dayfirst=True, errors="coerce"),
+        # FINBERT_LABEL has 3 values → dictionary-encoded categorical
+        FINBERT_LABEL=df["FINBERT_LABEL"].astype("category"),
+    )
+    # Probabilities/scores need no more than float32
+    score_cols = [c for c in FINBERT_FLOAT_COLS if c in df.columns]
+    df[score_cols] = df[score_cols].astype(np.float32)
+
+    table = table_with_metadata(df, metadata)
+
+    NEWS_PARQUET.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, NEWS_PARQUET, compression="zstd")
+
+    print(f"💾 Parquet cache saved ({len(df):,} rows) → {NEWS_PARQUET}")
+    return NEWS_PARQUET
+
+
+def read_news_metadata(key: str) -> str | None:
+    """Return one schema metadata value of the Parquet cache (None if absent)."""
+    if not NEWS_PARQUET.exists():
+        return None
+    value = (pq.read_schema(NEWS_PARQUET).metadata or {}).get(key.encode())
+    return value.decode() if value is not None else None
+
+
+def build_news_cache() -> Path:
+    """Parse the FinBERT CSV once and store it as typed, compressed Parquet."""
+    if not NEWS_CSV.exists():
+        raise FileNotFoundError(f"FinBERT CSV not found at: {NEWS_CSV}")
+
+    print(f"📄 Reading FinBERT news → {NEWS_CSV}")
+    # FINBERT_LABEL has 3 values → interned as categorical while parsing;
+    # scores are parsed straight into float32 (no float64 intermediate)
+    dtypes = {"FINBERT_LABEL": "category", **{c: np.float32 for c in FINBERT_FLOAT_COLS}}
+    df = pd.read_csv(NEWS_CSV, dtype=dtypes)
+    return write_news_parquet(df)
+
+
+def news_parquet() -> Path:
+    """
+    Return the FinBERT news Parquet path. sentiment_finbert writes it directly,
+    so it is only built from the CSV when missing; an existing file is never
+    overwritten (a newer CSV, e.g. after a git checkout, only triggers a warning).
+    """
+    if not NEWS_PARQUET.exists():
+        return build_news_cache()
+
+    if NEWS_CSV.exists() and NEWS_PARQUET.stat().st_mtime < NEWS_CSV.stat().st_mtime:
+        print(
+            f"⚠️ {NEWS_CSV.name} is newer than {NEWS_PARQUET.name}; using the Parquet file. "
+            f"Run `python cache_news.py --force` to rebuild it from the CSV."
+        )
+    return NEWS_PARQUET
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FinBERT news Parquet from the CSV.")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="overwrite an existing Parquet file (including sentiment_finbert output)",
+    )
+    args = parser.parse_args()
+
+    if NEWS_PARQUET.exists() and not args.force:
+        print(f"ℹ️ {NEWS_PARQUET} already exists; pass --force to rebuild it from {NEWS_CSV.name}.")
+        return
+    build_news_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,107 @@
+import os
+
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: no GUI backend needed to write PNGs
 import matplotlib.pyplot as plt
 from pathlib import Path
 
 # ---------- CONFIG ----------
 ROOT = Path(__file__).resolve().parents[1]
 
-PANEL_FILE        = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.csv"
+PANEL_FILE        = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.parquet"
 LEAD_LAG_CSV      = ROOT / "data" / "processed" / "lead_lag_sentiment_return.csv"
 LEAD_LAG_PLOT_PNG = ROOT / "data" / "processed" / "lead_lag_sentiment_return_linechart.png"
+LAG_SWEEP_CSV     = ROOT / "data" / "processed" / "lead_lag_sweep.csv"
 
 # date range you’ve been using
 START_DATE = "2025-08-08"
 END_DATE   = "2025-11-17"
+
+# Lags (trading rows) scanned for corr(sentiment_t, return_t+k)
+MAX_LAG = 5
+
+# Output resolution (override with PLOT_DPI=300 for publication plots)
+DPI = int(os.environ.get("PLOT_DPI", "150"))
 # -----------------------------
 
 
+def lagged_corr(sent: np.ndarray, ret: np.ndarray, k: int) -> float:
+    """Correlation of sentiment at t with return at t+k (k < 0 → return leads)."""
+    n = len(sent)
+    if abs(k) >= n:  # no overlapping rows (window shorter than the lag)
+        return np.nan
+    if k >= 0:
+        a, b = sent[:n - k], ret[k:]
+    else:
+        a, b = sent[-k:], ret[:n + k]
+    m = ~(np.isnan(a) | np.isnan(b))
+    if m.sum() < 2:
+        return np.nan
+    return np.corrcoef(a[m], b[m])[0, 1]
+
+
 def main():
     print(f"📄 Loading panel → {PANEL_FILE}")
-    df = pd.read_csv(PANEL_FILE)
+    # Date range filter is pushed down into the Parquet reader
+    df = pd.read_parquet(
+        PANEL_FILE,
+        columns=["DATE", "RETURN", "DAILY_SENTIMENT"],
+        filters=[
+            ("DATE", ">=", pd.Timestamp(START_DATE)),
+            ("DATE", "<=", pd.Timestamp(END_DATE)),
+        ],
+    )
 
-    # Ensure DATE + numeric types
+    # Ensure DATE (already datetime64 in the Parquet panel) + numeric types
     if "DATE" not in df.columns:
         raise KeyError("Expected a DATE column in the panel file.")
 
-    df["DATE"] = pd.to_datetime(df["DATE"])
     df["RETURN"] = pd.to_numeric(df["RETURN"], errors="coerce")
     df["DAILY_SENTIMENT"] = pd.to_numeric(df["DAILY_SENTIMENT"], errors="coerce")
 
-    # Filter to the chosen date range
-    mask = (df["DATE"] >= START_DATE) & (df["DATE"] <= END_DATE)
-    df = df.loc[mask].sort_values("DATE").reset_index(drop=True)
+    df = df.sort_values("DATE").reset_index(drop=True)
 
     if df.empty:
         raise ValueError("No rows after date filtering – check START_DATE / END_DATE.")
 
     # -------- 1) BUILD LEAD/LAG SERIES --------
-    # Sentiment at day t
-    # Return at day t+1 (shifted up / negative index shift)
-    df["RETURN_TOMORROW"] = df["RETURN"].shift(-1)
+    # Sentiment at day t vs return at day t+1 (array slicing, last row has no tomorrow)
+    sent = df["DAILY_SENTIMENT"].to_numpy(dtype=np.float64)
+    ret  = df["RETURN"].to_numpy(dtype=np.float64)
+    s_t, r_t1 = sent[:-1], ret[1:]
+    m = ~(np.isnan(s_t) | np.isnan(r_t1))
 
-    # Drop last row (no tomorrow return)
-    lead_lag = df[["DATE", "DAILY_SENTIMENT", "RETURN_TOMORROW"]].dropna().copy()
+    if m.sum() < 2:
+        raise ValueError("Lead/lag series is empty – check RETURN column.")
 
-    if lead_lag.empty:
-        raise ValueError("Lead/lag dataframe is empty – check RETURN column.")
+    lead_lag = pd.DataFrame({
+        "DATE": df["DATE"].to_numpy()[:-1][m],
+        "DAILY_SENTIMENT": s_t[m],
+        "RETURN_TOMORROW": r_t1[m],
+    })
 
     # -------- 2) GLOBAL CORRELATION --------
-    corr_val = lead_lag["DAILY_SENTIMENT"].corr(lead_lag["RETURN_TOMORROW"])
+    corr_val = np.corrcoef(s_t[m], r_t1[m])[0, 1]
     print("\n━━━━━━━━━━━━━━━━━━━━━━")
     print("📈 LEAD/LAG CORRELATION")
     print("Sentiment today  vs  Return tomorrow")
     print(f"Correlation(DAILY_SENTIMENT_t, RETURN_t+1) = {corr_val:.4f}")
     print("━━━━━━━━━━━━━━━━━━━━━━\n")
 
+    # Sweep lags -MAX_LAG..MAX_LAG (k > 0: sentiment leads return)
+    sweep = pd.DataFrame({"LAG": range(-MAX_LAG, MAX_LAG + 1)})
+    sweep["CORR"] = [lagged_corr(sent, ret, k) for k in sweep["LAG"]]
+    print("🔁 Lag sweep: Correlation(DAILY_SENTIMENT_t, RETURN_t+k)")
+    print(sweep.to_string(index=False, float_format="{:.4f}".format))
+
     # -------- 3) SAVE CSV --------
     LEAD_LAG_CSV.parent.mkdir(parents=True, exist_ok=True)
     lead_lag.to_csv(LEAD_LAG_CSV, index=False)
     print(f"💾 Lead/lag data saved → {LEAD_LAG_CSV}")
+    sweep.to_csv(LAG_SWEEP_CSV, index=False)
+    print(f"💾 Lag sweep saved → {LAG_SWEEP_CSV}")
 
     # -------- 4) LINE CHART (like earlier) --------
     fig, ax1 = plt.subplots(figsize=(14, 6))
@@ -91,7 +136,7 @@ def main():
     fig.tight_layout()
 
     LEAD_LAG_PLOT_PNG.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(LEAD_LAG_PLOT_PNG, dpi=300)
+    plt.savefig(LEAD_LAG_PLOT_PNG, dpi=DPI)
     plt.close()
 
     print(f"📉 Lead/lag line chart saved → {LEAD_LAG_PLOT_PNG}")
@@ -1,4 +1,8 @@
+import os
+
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: no GUI backend needed to write PNGs
 import matplotlib.pyplot as plt
 import seaborn as sns   # (still fine, though not used here)
 import matplotlib.dates as mdates
@@ -7,27 +11,31 @@ from pathlib import Path
 # ---------------- CONFIG ----------------
 ROOT = Path(__file__).resolve().parents[1]
 
-PANEL_FILE   = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.csv"
+PANEL_FILE   = ROOT / "data" / "processed" / "panel_AAPL_O_sentiment_prices.parquet"
 SCATTER_PLOT = ROOT / "data" / "processed" / "headlines_vs_volume_scatter.png"
 LINE_PLOT    = ROOT / "data" / "processed" / "headlines_vs_volume_line.png"
 
 START_DATE = pd.Timestamp("2025-08-08")
 END_DATE   = pd.Timestamp("2025-11-17")
+
+# Output resolution (override with PLOT_DPI=300 for publication plots)
+DPI = int(os.environ.get("PLOT_DPI", "150"))
 # ----------------------------------------
 
 
 def main():
     print(f"📄 Loading panel → {PANEL_FILE}")
-    df = pd.read_csv(PANEL_FILE)
+    # Date range filter is pushed down into the Parquet reader
+    df = pd.read_parquet(
+        PANEL_FILE,
+        columns=["DATE", "VOLUME", "NUM_HEADLINES"],
+        filters=[("DATE", ">=", START_DATE), ("DATE", "<=", END_DATE)],
+    )
 
-    # Prepare dataset
-    df["DATE"] = pd.to_datetime(df["DATE"])
+    # Prepare dataset (DATE is already datetime64 in the Parquet panel)
     df["VOLUME"] = pd.to_numeric(df["VOLUME"], errors="coerce")
     df["NUM_HEADLINES"] = pd.to_numeric(df["NUM_HEADLINES"], errors="coerce")
 
-    # Filter the period
-    df = df[(df["DATE"] >= START_DATE) & (df["DATE"] <= END_DATE)]
-
     # ---------- DUAL-AXIS LINE CHART ----------
     fig, ax1 = plt.subplots(figsize=(12, 6))
 
@@ -69,7 +77,7 @@ def main():
     fig.tight_layout()
 
     LINE_PLOT.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(LINE_PLOT, dpi=300)
+    plt.savefig(LINE_PLOT, dpi=DPI)
     plt.close()
 
     print(f"📌 Line chart saved → {LINE_PLOT}")
@@ -1,20 +1,49 @@
+import argparse
+import hashlib
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-
+from torch.utils.data import DataLoader, Dataset
+from numba import njit, prange
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+from cache_news import read_news_metadata, table_with_metadata, write_news_parquet
+
+# ---- Optional ONNX Runtime INT8 path for CPU (falls back to PyTorch) ----
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ort = None
+
+# ---- Optional BetterTransformer (packed nested tensors skip PAD tokens) ----
+try:
+    from optimum.bettertransformer import BetterTransformer
+except ImportError:
+    BetterTransformer = None
 
 # --------- CONFIG ---------
 MODEL_NAME   = "ProsusAI/finbert"
 INPUT_CSV    = Path(__file__).resolve().parents[1] / "data" / "raw" / "news_AAPL.O.csv"
 OUTPUT_DIR   = Path(__file__).resolve().parents[1] / "data" / "processed"
 OUTPUT_CSV   = OUTPUT_DIR / "news_AAPL.O_finbert.csv"
+SCORE_CACHE  = OUTPUT_DIR / "finbert_cache.parquet"  # headline hash → (POS, NEG)
+SCORE_CACHE_KEY = "finbert_score_config"  # Parquet metadata key: what produced the cache
 
 HEADLINE_COL_CANDIDATES = ["HEADLINE", "headline", "Title", "title"]
-BATCH_SIZE   = 16
-MAX_LENGTH   = 128
+TOKEN_BUDGET = 4096   # max padded tokens per batch on CPU (rows × longest row)
+GPU_PROBE_ROWS = [128, 64, 32]  # full-length batch sizes tried on CUDA, largest first
+LOADER_WORKERS = 2    # CUDA only: DataLoader processes padding/pinning the next buckets
+MAX_LENGTH   = 128    # truncation limit only; batches pad to their longest row
+MIN_CONTENT_TOKENS = 3  # shorter headlines (e.g. "Apple.") skip BERT and score as neutral
+LABEL_THRESHOLD = 0.05  # |POS - NEG| below this is labelled neutral
+LABEL_NAMES  = np.array(["negative", "neutral", "positive"])  # indexed by label code + 1
+RUN_HASH_KEY = "finbert_run_hash"  # Parquet metadata key: input CSV + scoring config
 # --------------------------
 
 
@@ -29,60 +58,315 @@ def find_headline_column(df: pd.DataFrame) -> str:
     )
 
 
+def load_onnx_int8():
+    """
+    Export FinBERT to ONNX and quantize it to INT8 (dynamic, AVX512-VNNI),
+    caching the result under OUTPUT_DIR. Returns an onnxruntime session.
+    Delete the cache folder to force a fresh export.
+    """
+    onnx_dir = OUTPUT_DIR / f"{Path(MODEL_NAME).name}_onnx_int8"
+    onnx_file = onnx_dir / "model_quantized.onnx"
+
+    if not onnx_file.exists():
+        print(f"⚙️ Exporting + INT8-quantizing ONNX model → {onnx_dir}")
+        ort_model = ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True)
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=onnx_dir, quantization_config=qconfig)
+
+    print(f"🧮 Using ONNX Runtime INT8 model: {onnx_file}")
+    return ort.InferenceSession(str(onnx_file), providers=["CPUExecutionProvider"])
+
+
 def load_finbert():
-    """Load tokenizer & model, move model to CPU/GPU."""
+    """
+    Load tokenizer & model. On GPU (or without onnxruntime/optimum) this is the
+    PyTorch model; on CPU it is an INT8 ONNX Runtime session.
+    """
     print(f"📥 Loading FinBERT model: {MODEL_NAME}")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+    config = AutoConfig.from_pretrained(MODEL_NAME)
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device)
-    model.eval()
+    if device.type == "cpu" and ort is not None:
+        model = load_onnx_int8()
+    else:
+        # Fused SDPA attention (FlashAttention on GPU); FP16 weights on GPU for Tensor Cores
+        model = AutoModelForSequenceClassification.from_pretrained(
+            MODEL_NAME,
+            attn_implementation="sdpa",
+            torch_dtype=torch.float16 if device.type == "cuda" else torch.float32,
+        )
+        print(f"⚡ Attention implementation: {model.config._attn_implementation}")
+        model.to(device)
+        model.eval()
+
+        # Packed nested-tensor fast path, where optimum still supports it;
+        # recent transformers refuse BERT here in favour of the SDPA path above
+        if BetterTransformer is not None:
+            try:
+                model = BetterTransformer.transform(model, keep_original_model=False)
+                print("🧩 BetterTransformer enabled (padding skipped in attention/FFN)")
+            except (ValueError, NotImplementedError) as e:
+                print(f"ℹ️ BetterTransformer not applied: {e}")
+
+        # GPU: compiled graph. Length buckets give nearly every batch its own
+        # (rows, max_len), so compile shape-polymorphic and skip CUDA graphs,
+        # which would re-record for each new shape
+        if device.type == "cuda":
+            model = torch.compile(
+                model, mode="max-autotune-no-cudagraphs", dynamic=True, fullgraph=False
+            )
 
     # label mapping e.g. {0: 'negative', 1: 'neutral', 2: 'positive'}
-    id2label = model.config.id2label
+    id2label = config.id2label
     label2id = {v.lower(): k for k, v in id2label.items()}
 
     pos_idx = label2id["positive"]
     neg_idx = label2id["negative"]
-    neu_idx = label2id["neutral"]
 
     print(f"🔤 FinBERT label mapping: {id2label}")
-    return tokenizer, model, device, pos_idx, neg_idx, neu_idx
+    return tokenizer, model, device, pos_idx, neg_idx
+
+
+def probe_token_budget(model, device) -> int:
+    """
+    Pick the per-batch token budget for this device.
+    On CUDA, forward full MAX_LENGTH batches of GPU_PROBE_ROWS rows and keep
+    the largest that fits in memory; elsewhere use TOKEN_BUDGET.
+    """
+    if device.type != "cuda":
+        return TOKEN_BUDGET
 
+    for rows in GPU_PROBE_ROWS:
+        ids = torch.ones((rows, MAX_LENGTH), dtype=torch.long)
+        try:
+            predict_probs(model, {"input_ids": ids, "attention_mask": torch.ones_like(ids)}, device)
+        except torch.cuda.OutOfMemoryError:
+            torch.cuda.empty_cache()
+            continue
+        budget = rows * MAX_LENGTH
+        print(f"📏 GPU batch probe: {rows} × {MAX_LENGTH} fits → token budget {budget}")
+        return budget
 
-def chunked(iterable, size):
-    """Yield successive chunks from a list."""
-    for i in range(0, len(iterable), size):
-        yield iterable[i:i + size]
+    print(f"⚠️ GPU batch probe: nothing fit, falling back to token budget {TOKEN_BUDGET}")
+    return TOKEN_BUDGET
 
 
-def score_with_finbert(texts, tokenizer, model, device, pos_idx, neg_idx, neu_idx):
+def length_buckets(lengths: np.ndarray, token_budget: int):
     """
-    Run FinBERT on a list of texts.
-    Returns three lists: positive_probs, negative_probs, neutral_probs.
+    Yield index arrays of similar-length texts (shortest first).
+    Each bucket keeps rows × longest row within token_budget, so short
+    headlines get big batches and padding stays minimal.
     """
-    all_pos, all_neg, all_neu = [], [], []
-
-    for batch in chunked(texts, BATCH_SIZE):
-        enc = tokenizer(
-            batch,
-            padding=True,
-            truncation=True,
-            max_length=MAX_LENGTH,
+    bucket = []
+    for i in np.argsort(lengths, kind="stable"):
+        if bucket and (len(bucket) + 1) * lengths[i] > token_budget:
+            yield np.asarray(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        yield np.asarray(bucket)
+
+
+class PaddedBuckets(Dataset):
+    """Length buckets of pre-tokenized texts; each item is (row indices, padded batch)."""
+
+    def __init__(self, tokenizer, enc_all, buckets):
+        self.tokenizer = tokenizer
+        self.enc_all = enc_all
+        self.buckets = buckets
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def __getitem__(self, i):
+        idx = self.buckets[i]
+        # Pad the pre-tokenized bucket to its longest row (no re-tokenizing)
+        enc = self.tokenizer.pad(
+            {k: [v[j] for j in idx] for k, v in self.enc_all.items()},
+            padding="longest",
             return_tensors="pt",
         )
-        enc = {k: v.to(device) for k, v in enc.items()}
+        return idx, dict(enc)
+
+
+def is_onnx(model) -> bool:
+    """True for the ONNX Runtime INT8 session, False for a PyTorch model."""
+    return ort is not None and isinstance(model, ort.InferenceSession)
+
+
+def forward_probs(model, enc, device) -> torch.Tensor:
+    """PyTorch forward of one batch; returns FP32 softmax probabilities, left on device."""
+    # Pinned batches (from the DataLoader) copy asynchronously; ids stay int64
+    enc = {k: v.to(device, non_blocking=True) for k, v in enc.items()}
+    use_fp16 = device.type == "cuda"
+    with torch.inference_mode(), torch.autocast(
+        device_type=device.type, dtype=torch.float16, enabled=use_fp16
+    ):
+        logits = model(**enc).logits
+        # softmax in FP32 for numerically safe probabilities
+        return torch.softmax(logits.float(), dim=-1)
+
+
+def predict_probs(model, enc, device) -> np.ndarray:
+    """Forward one tokenized batch; returns softmax probabilities (batch × labels)."""
+    if is_onnx(model):
+        feeds = {i.name: enc[i.name].numpy() for i in model.get_inputs()}
+        logits = model.run(None, feeds)[0]
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return (exp / exp.sum(axis=-1, keepdims=True)).astype(np.float32, copy=False)
+
+    return forward_probs(model, enc, device).cpu().numpy()
+
+
+def score_with_finbert(
+    texts, tokenizer, model, device, pos_idx, neg_idx, token_budget=TOKEN_BUDGET
+):
+    """
+    Run FinBERT on an object ndarray of texts, batched by token length.
+    Duplicate texts are scored once and fanned back out to every row.
+    Texts with fewer than MIN_CONTENT_TOKENS word-piece tokens carry no real
+    signal; they get pos = neg = 0 (i.e. fully neutral) without a forward pass.
+    Returns two float32 arrays: positive_probs, negative_probs
+    (neutral is 1 - pos - neg, so it is not carried around).
+    """
+    # Republished headlines are common → only score each distinct text once
+    uniq, inverse = np.unique(texts, return_inverse=True)
+    texts = uniq.tolist()
+    print(f"🧹 {len(texts):,} unique headlines ({len(inverse) - len(texts):,} duplicates skipped)")
+
+    # Tokenize everything in one (multithreaded) call; token lengths decide the buckets
+    enc_all = tokenizer(texts, padding=False, truncation=True, max_length=MAX_LENGTH)
+    lengths = np.array([len(ids) for ids in enc_all["input_ids"]])
+    # One preallocated (pos, neg) buffer; batches write into it (no per-float Python objects)
+    cols = [pos_idx, neg_idx]
+    probs_all = np.empty((len(texts), 2), dtype=np.float32)
+
+    # Near-empty headlines → neutral, no forward pass
+    n_special = tokenizer.num_special_tokens_to_add(pair=False)
+    trivial = lengths - n_special < MIN_CONTENT_TOKENS
+    probs_all[trivial] = 0.0
+    keep = np.flatnonzero(~trivial)
+    print(f"🪶 {int(trivial.sum()):,} headlines under {MIN_CONTENT_TOKENS} tokens scored as neutral")
+
+    # On CUDA, workers pad and pin upcoming buckets while the model runs;
+    # on CPU the model is the bottleneck and worker start-up isn't worth it
+    buckets = [keep[b] for b in length_buckets(lengths[keep], token_budget)]
+    on_gpu = device.type == "cuda" and not is_onnx(model)
+    loader = DataLoader(
+        PaddedBuckets(tokenizer, enc_all, buckets),
+        batch_size=None,  # each item is already a whole bucket
+        num_workers=LOADER_WORKERS if device.type == "cuda" else 0,
+        pin_memory=on_gpu,
+    )
+
+    if on_gpu:
+        # Results stay on the GPU until the end → no device sync per batch
+        out = torch.empty(probs_all.shape, dtype=torch.float32, device=device)
+        for idx, enc in loader:
+            out[idx.to(device, non_blocking=True)] = forward_probs(model, enc, device)[:, cols]
+        torch.cuda.synchronize()
+        probs_all[keep] = out[torch.from_numpy(keep).to(device)].cpu().numpy()
+    else:
+        for idx, enc in loader:
+            # Scatter straight back into the original row order
+            probs_all[idx.numpy()] = predict_probs(model, enc, device)[:, cols]
+
+    # Unique rows → original rows (only the two columns anyone needs)
+    inverse = inverse.ravel()
+    return probs_all[inverse, 0], probs_all[inverse, 1]
+
+
+def scoring_backend() -> str:
+    """Backend/precision load_finbert picks on this machine (no model load needed)."""
+    if torch.cuda.is_available():
+        return "torch-fp16"
+    if ort is not None:
+        return "onnx-int8"
+    return "torch-fp32"
+
+
+def score_config() -> str:
+    """
+    Everything besides the headline that changes its probabilities.
+    Shared by the score cache and run_hash, so both invalidate on the same changes.
+    """
+    return (
+        f"model={MODEL_NAME}|backend={scoring_backend()}"
+        f"|max_length={MAX_LENGTH}|min_tokens={MIN_CONTENT_TOKENS}"
+    )
+
+
+def score_with_cache(texts, tokenizer, model, device, pos_idx, neg_idx, token_budget):
+    """
+    Like score_with_finbert (texts as an object ndarray of str), but reuse
+    probabilities from SCORE_CACHE.
+    Headlines are keyed by a 64-bit hash; only cache misses go through
+    FinBERT, and their scores are appended to the cache.
+    The cache records its score_config; a different model, backend/precision,
+    MAX_LENGTH or MIN_CONTENT_TOKENS discards it and re-scores everything.
+    """
+    keys = pd.util.hash_pandas_object(pd.Series(texts, copy=False), index=False).to_numpy()
+    config = score_config()
+
+    cached_config = None
+    if SCORE_CACHE.exists():
+        meta = pq.read_schema(SCORE_CACHE).metadata or {}
+        cached_config = meta.get(SCORE_CACHE_KEY.encode(), b"").decode()
+        if cached_config != config:
+            print(f"♻️ Score cache was built with '{cached_config}', now '{config}' → discarded")
+
+    if cached_config == config:
+        cache = pd.read_parquet(SCORE_CACHE, engine="pyarrow")
+    else:
+        cache = pd.DataFrame({
+            "KEY": np.empty(0, np.uint64),
+            "POS": np.empty(0, np.float32),
+            "NEG": np.empty(0, np.float32),
+        })
+
+    miss = np.flatnonzero(~np.isin(keys, cache["KEY"].to_numpy()))
+    print(f"🗃️ Score cache: {len(texts) - len(miss):,} hits, {len(miss):,} misses")
+
+    if len(miss):
+        pos, neg = score_with_finbert(
+            texts[miss], tokenizer, model, device, pos_idx, neg_idx, token_budget
+        )
+        new = pd.DataFrame({"KEY": keys[miss], "POS": pos, "NEG": neg})
+        cache = pd.concat(
+            [cache[["KEY", "POS", "NEG"]], new], ignore_index=True
+        ).drop_duplicates("KEY")
+        table = table_with_metadata(cache, {SCORE_CACHE_KEY: config})
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, SCORE_CACHE, compression="zstd")
 
-        with torch.no_grad():
-            logits = model(**enc).logits
-            probs = torch.softmax(logits, dim=-1).cpu().numpy()
+    probs = cache.set_index("KEY").loc[keys, ["POS", "NEG"]].to_numpy(np.float32)
+    return probs[:, 0], probs[:, 1]
+
+
+@njit(parallel=True, cache=True)
+def finalize_scores(pos, neg, threshold):
+    """
+    Fused score + label pass: score = pos - neg, and an int8 label code
+    (-1 negative, 0 neutral, 1 positive) from the ±threshold cut-offs.
+    """
+    n = pos.shape[0]
+    score = np.empty_like(pos)
+    label = np.empty(n, np.int8)
 
-        all_pos.extend(probs[:, pos_idx].tolist())
-        all_neg.extend(probs[:, neg_idx].tolist())
-        all_neu.extend(probs[:, neu_idx].tolist())
+    for i in prange(n):
+        s = pos[i] - neg[i]
+        score[i] = s
+        if s > threshold:
+            label[i] = 1
+        elif s < -threshold:
+            label[i] = -1
+        else:
+            label[i] = 0
 
-    return all_pos, all_neg, all_neu
+    return score, label
 
 
 def add_date_from_timestamp(df: pd.DataFrame) -> pd.DataFrame:
@@ -98,28 +382,56 @@ def add_date_from_timestamp(df: pd.DataFrame) -> pd.DataFrame:
     print("⏱ Parsing TIMESTAMP → DATE ...")
     ts = pd.to_datetime(df["TIMESTAMP"], errors="coerce", utc=True)
 
-    df["TIMESTAMP_PARSED"] = ts  # keep parsed version just in case
-    df["DATE"] = ts.dt.date      # pure date (no time)
-
     # Count and drop rows with invalid timestamps
-    bad = df["DATE"].isna().sum()
+    mask = ts.notna()
+    bad = len(mask) - int(mask.sum())
     if bad > 0:
         print(f"⚠️ Dropping {bad} rows with invalid TIMESTAMP.")
-        df = df.dropna(subset=["DATE"]).reset_index(drop=True)
+        df = df.loc[mask].reset_index(drop=True)
+        ts = ts[mask]
 
-    # Format as dd/mm/yyyy for the output CSV (nice for Excel)
-    df["DATE"] = pd.to_datetime(df["DATE"]).dt.strftime("%d/%m/%Y")
+    # Format the parsed datetimes once as dd/mm/yyyy (nice for Excel)
+    df["DATE"] = ts.dt.strftime("%d/%m/%Y").to_numpy()
 
     return df
 
 
+def run_hash() -> str:
+    """
+    Content hash of the input CSV plus everything that changes the scores.
+    A matching hash in the output Parquet means re-running would be a no-op.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(INPUT_CSV, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(f"{score_config()}|label_threshold={LABEL_THRESHOLD}".encode())
+    return h.hexdigest()
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Score news headlines with FinBERT.")
+    parser.add_argument(
+        "--csv", action="store_true",
+        help=f"also write the legacy CSV ({OUTPUT_CSV.name}) next to the Parquet output",
+    )
+    args = parser.parse_args()
+
     # ---------- Load CSV ----------
     if not INPUT_CSV.exists():
         raise FileNotFoundError(f"Input CSV not found at: {INPUT_CSV}")
 
+    # ---------- Skip unchanged re-runs ----------
+    # --csv always runs: the committed CSV can't tell us which run produced it
+    # (already-scored headlines are still served by the score cache)
+    current_hash = run_hash()
+    if not args.csv and read_news_metadata(RUN_HASH_KEY) == current_hash:
+        print(f"⏭️ Input and config unchanged (hash {current_hash}); output is up to date.")
+        return
+
     print(f"📄 Reading news from: {INPUT_CSV}")
-    df = pd.read_csv(INPUT_CSV)
+    # Multithreaded Arrow parser; columns stay Arrow-backed (no object dtype)
+    df = pd.read_csv(INPUT_CSV, engine="pyarrow", dtype_backend="pyarrow")
 
     # Identify headline column
     headline_col = find_headline_column(df)
@@ -135,35 +447,41 @@ def main():
     df = add_date_from_timestamp(df)
 
     # ---------- Load FinBERT ----------
-    tokenizer, model, device, pos_idx, neg_idx, neu_idx = load_finbert()
+    tokenizer, model, device, pos_idx, neg_idx = load_finbert()
+    token_budget = probe_token_budget(model, device)
 
     # ---------- Run sentiment ----------
-    headlines = df[headline_col].astype(str).tolist()
+    # Object ndarray of str, no intermediate Python list
+    headlines = df[headline_col].astype(str).to_numpy(dtype=object)
     print(f"🔎 Scoring {len(headlines)} headlines with FinBERT...")
 
-    pos, neg, neu = score_with_finbert(
-        headlines, tokenizer, model, device, pos_idx, neg_idx, neu_idx
+    pos, neg = score_with_cache(
+        headlines, tokenizer, model, device, pos_idx, neg_idx, token_budget
     )
 
-    # Add sentiment columns
+    # Add sentiment columns (ndarrays are stored as-is, no boxing)
     df["FINBERT_POS"] = pos
     df["FINBERT_NEG"] = neg
-    df["FINBERT_NEU"] = neu
+    # Softmax rows sum to 1 → neutral once, vectorized (clip float32 round-off)
+    df["FINBERT_NEU"] = np.clip(1.0 - pos - neg, 0.0, 1.0, dtype=np.float32)
 
-    # Continuous score: POS - NEG  (≈ [-1, 1])
-    df["FINBERT_SCORE"] = df["FINBERT_POS"] - df["FINBERT_NEG"]
-
-    # Discrete label
-    df["FINBERT_LABEL"] = df["FINBERT_SCORE"].apply(
-        lambda x: "positive" if x > 0.05 else ("negative" if x < -0.05 else "neutral")
-    )
+    # Continuous score POS - NEG (≈ [-1, 1]) and discrete label in one compiled pass
+    score, label = finalize_scores(pos, neg, LABEL_THRESHOLD)
+    df["FINBERT_SCORE"] = score.astype(np.float32, copy=False)  # float32 like the probs
+    df["FINBERT_LABEL"] = LABEL_NAMES[label + 1]
 
     # ---------- Save ----------
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    df.to_csv(OUTPUT_CSV, index=False)
+    if args.csv:
+        # pandas writer keeps the committed CSV layout (minimal quoting, pandas timestamps)
+        df.to_csv(OUTPUT_CSV, index=False)
+        print(f"📄 CSV copy → {OUTPUT_CSV}")
+
+    # Parquet last, so it is never older than the CSV (cache_news.news_parquet)
+    output_parquet = write_news_parquet(df, metadata={RUN_HASH_KEY: current_hash})
 
-    print(f"✅ Done. Saved {len(df):,} rows → {OUTPUT_CSV}")
-    print("📑 Columns now include: DATE (dd/mm/yyyy), "
+    print(f"✅ Done. Saved {len(df):,} rows → {output_parquet}")
+    print("📑 Columns now include: DATE, "
           "FINBERT_POS, FINBERT_NEG, FINBERT_NEU, FINBERT_SCORE, FINBERT_LABEL")
     print(df[[headline_col, "DATE", "FINBERT_SCORE", "FINBERT_LABEL"]].head())
 
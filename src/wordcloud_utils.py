@@ -0,0 +1,140 @@
+# wordcloud_utils.py
+
+import re
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: no GUI backend needed to write PNGs
+import matplotlib.colors as mcolors
+import matplotlib.pyplot as plt
+from wordcloud import WordCloud
+
+# Word clouds are published figures → always 300 dpi (PLOT_DPI does not apply)
+DPI = 300
+
+# Bar colour for the Top Words legend (checked once at import)
+LEGEND_COLOR = "tab:purple"
+assert mcolors.is_color_like(LEGEND_COLOR), f"Invalid legend colour: {LEGEND_COLOR}"
+
+# Word tokens (2+ letters / apostrophes), compiled once
+TOKEN_RE  = re.compile(r"[A-Za-z']{2,}")
+MAX_WORDS = 200
+
+
+def tokenize(headlines: pd.Series) -> pd.Series:
+    """Lowercase + tokenize every headline once (list of words per row)."""
+    return headlines.astype("string").str.lower().map(TOKEN_RE.findall)
+
+
+def _clean(token: str) -> str:
+    """Drop possessive 's and stray quotes (e.g. "apple's" → "apple")."""
+    return token.removesuffix("'s").strip("'")
+
+
+def _fold_plurals(ctr: Counter) -> Counter:
+    """
+    Merge "word"+"s" into "word" when both occur (not for "-ss" endings),
+    like WordCloud's normalize_plurals; run after stopword removal, as it does.
+    """
+    plurals = [w for w in ctr if w.endswith("s") and not w.endswith("ss") and w[:-1] in ctr]
+    for w in plurals:
+        ctr[w[:-1]] += ctr.pop(w)
+    return ctr
+
+
+def word_counts(tokens, stopwords: frozenset) -> Counter:
+    """Count words over an iterable of token lists, without stopwords, plurals folded."""
+    ctr = Counter()
+    for toks in tokens:
+        ctr.update(_clean(t) for t in toks)
+    for w in stopwords & ctr.keys():
+        del ctr[w]
+    ctr.pop("", None)
+    return _fold_plurals(ctr)
+
+
+def sentiment_word_counts(tokens: pd.Series, scores: pd.Series,
+                          pos_threshold: float, neg_threshold: float,
+                          stopwords: frozenset):
+    """
+    One pass over the tokenized headlines → (all, very positive, very negative)
+    word Counters, split by FINBERT_SCORE thresholds (plurals folded).
+    """
+    all_ctr, pos_ctr, neg_ctr = Counter(), Counter(), Counter()
+    for toks, score in zip(tokens, scores):
+        words = [_clean(t) for t in toks]
+        all_ctr.update(words)
+        if score >= pos_threshold:
+            pos_ctr.update(words)
+        elif score <= neg_threshold:
+            neg_ctr.update(words)
+
+    for ctr in (all_ctr, pos_ctr, neg_ctr):
+        for w in stopwords & ctr.keys():
+            del ctr[w]
+        ctr.pop("", None)
+        _fold_plurals(ctr)
+    return all_ctr, pos_ctr, neg_ctr
+
+
+def build_wc(top_words) -> WordCloud:
+    """
+    Lay out a WordCloud from (word, count) pairs.
+    Callers reuse `.words_` for the Top Words legend instead of recounting.
+    """
+    return WordCloud(
+        width=1600,
+        height=900,
+        background_color="white",
+        max_words=MAX_WORDS,
+    ).generate_from_frequencies(dict(top_words))
+
+
+def make_wordcloud(counts: Counter, title: str, out_path: Path):
+    """Generate and save a word cloud with a Top Words bar legend."""
+    if not counts:
+        print(f"⚠️ No words for '{title}', skipping word cloud.")
+        return
+
+    # ---- Build word cloud ----
+    wc = build_wc(counts.most_common(MAX_WORDS))
+
+    # ---- Extract top words (normalized frequency 0–1) ----
+    word_freq = wc.words_  # dict: word -> normalized freq
+    top_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:20]
+
+    # ---- Figure with 2 panels: word cloud + bar legend ----
+    fig, (ax_wc, ax_leg) = plt.subplots(
+        1, 2, figsize=(16, 8), gridspec_kw={"width_ratios": [3, 2]}
+    )
+
+    # Left: word cloud
+    ax_wc.imshow(wc, interpolation="bilinear")
+    ax_wc.axis("off")
+    ax_wc.set_title(title, fontsize=20)
+
+    # Right: horizontal bar chart of top words
+    if top_words:
+        words = [w for w, _ in top_words]
+        freqs = [f for _, f in top_words]
+        y_pos = range(len(words))
+        ax_leg.barh(y_pos, freqs, color=LEGEND_COLOR, alpha=0.8)
+        ax_leg.set_yticks(y_pos)
+        ax_leg.set_yticklabels(words)
+        ax_leg.invert_yaxis()  # highest at top
+        ax_leg.set_xlabel("Normalized Frequency")
+        ax_leg.set_title("Top Words")
+    else:
+        ax_leg.text(0.5, 0.5, "No words", ha="center", va="center", fontsize=12)
+        ax_leg.axis("off")
+
+    fig.tight_layout()
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(out_path, dpi=DPI, bbox_inches="tight")
+    plt.close(fig)
+
+    print(f"🖼 Word cloud saved → {out_path}")
+